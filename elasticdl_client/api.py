@@ -11,13 +11,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import functools
+import hashlib
+import json
 import os
 import shutil
+import stat
+import sys
+import tempfile
+import time
+from concurrent import futures
 
-import docker
-from jinja2 import Template
-
-from elasticdl_client.common import k8s_client as k8s
 from elasticdl_client.common.args import (
     build_arguments_from_parsed_result,
     parse_envs,
@@ -29,6 +34,58 @@ from elasticdl_client.common.constants import (
 )
 from elasticdl_client.common.log_utils import default_logger as logger
 
+# Files in the build context which are never needed by the image. Keeping
+# them out of the context shrinks the tarball sent to the Docker daemon and
+# avoids invalidating the cached COPY layers when they change.
+_DOCKER_IGNORE_PATTERNS = [
+    ".git",
+    "**/__pycache__",
+    "**/*.pyc",
+    "**/*.egg-info",
+    "**/.pytest_cache",
+    ".venv",
+]
+# The stanzas of the Dockerfile generated by `elasticdl zoo init`. The
+# wheels downloaded by pip are not kept in the image since a layer can't be
+# reused as the pip cache of later builds. The ElasticDL packages are
+# installed and set up in a single RUN to save image layers.
+_SET_GO_PATH_COMMAND = (
+    "/bin/bash -c"
+    ' \'PYTHON_PKG_PATH=$(pip3 show elasticdl | grep "Location:"'
+    ' | cut -d " " -f2);'
+    ' echo "PATH=${{PYTHON_PKG_PATH}}/elasticdl/go/bin:$PATH" >>'
+    " /root/.bashrc_elasticdl;"
+    ' echo ". /root/.bashrc_elasticdl" >> /root/.bashrc\''
+)
+_DOCKERFILE_BASE = "FROM {base_image} as base\n"
+_DOCKERFILE_INSTALL_LOCAL_PKGS = (
+    "COPY {local_pkg_dir}/*.whl /\n"
+    "RUN pip install --no-cache-dir /*.whl"
+    " --extra-index-url={extra_pypi_index} \\\n"
+    "    && rm /*.whl \\\n"
+    "    && " + _SET_GO_PATH_COMMAND + "\n"
+)
+_DOCKERFILE_INSTALL_PKGS = (
+    "RUN pip install --no-cache-dir elasticdl_preprocessing elasticdl"
+    " --extra-index-url={extra_pypi_index} \\\n"
+    "    && " + _SET_GO_PATH_COMMAND + "\n"
+)
+_DOCKERFILE_INSTALL_MODEL_ZOO_REQUIREMENTS = (
+    "COPY {model_zoo_path}/requirements.txt /model_zoo/requirements.txt\n"
+    "RUN pip install --no-cache-dir -r /model_zoo/requirements.txt"
+    " --extra-index-url={extra_pypi_index}\n"
+)
+_DOCKERFILE_COPY_CLUSTER_SPEC = (
+    "COPY ./{cluster_spec_name} {cluster_spec_dir}/{cluster_spec_name}\n"
+)
+_DOCKERFILE_COPY_MODEL_ZOO = "COPY {model_zoo_path} /model_zoo\n"
+# The context hash and the ID of the images built by `elasticdl zoo build`
+_BUILD_CACHE_FILE = os.path.join(
+    os.path.expanduser("~"), ".elasticdl", "build_cache.json"
+)
+# The minimal interval between two refreshes of the push progress bar
+_PROGRESS_REFRESH_INTERVAL_SECS = 0.1
+
 
 def init_zoo(args):
     logger.info("Create the Dockerfile for the model zoo.")
@@ -48,149 +105,131 @@ def init_zoo(args):
         cluster_spec_name = os.path.basename(cluster_spec_path)
 
     # Create the docker file
-    # Build the content from the template and arguments
-    tmpl_str = """\
-FROM {{ BASE_IMAGE }} as base
-
-{% if LOCAL_PKG_DIR %}\
-COPY {{LOCAL_PKG_DIR}}/*.whl /
-RUN pip install /*.whl --extra-index-url={{ EXTRA_PYPI_INDEX }} && rm /*.whl
-{% else %}
-RUN pip install elasticdl_preprocessing\
- --extra-index-url={{ EXTRA_PYPI_INDEX }}
-
-RUN pip install elasticdl --extra-index-url={{ EXTRA_PYPI_INDEX }}
-{% endif -%}
-
-RUN /bin/bash -c\
- 'PYTHON_PKG_PATH=$(pip3 show elasticdl | grep "Location:" | cut -d " " -f2);\
- echo "PATH=${PYTHON_PKG_PATH}/elasticdl/go/bin:$PATH" >>\
- /root/.bashrc_elasticdl;\
- echo ". /root/.bashrc_elasticdl" >> /root/.bashrc'
-
-COPY {{MODEL_ZOO_PATH}} /model_zoo
-RUN pip install -r /model_zoo/requirements.txt\
- --extra-index-url={{ EXTRA_PYPI_INDEX }}
-
-{% if CLUSTER_SPEC_NAME  %}\
-COPY ./{{ CLUSTER_SPEC_NAME }} {{CLUSTER_SPEC_DIR}}/{{ CLUSTER_SPEC_NAME }}\
-{% endif %}
-"""
-    template = Template(tmpl_str)
-    docker_file_content = template.render(
-        BASE_IMAGE=args.base_image,
-        EXTRA_PYPI_INDEX=args.extra_pypi_index,
-        CLUSTER_SPEC_NAME=cluster_spec_name,
-        LOCAL_PKG_DIR=args.local_pkg_dir,
-        CLUSTER_SPEC_DIR=ClusterSpecConfig.CLUSTER_SPEC_DIR,
-        MODEL_ZOO_PATH=args.model_zoo,
+    # Build the content from the stanzas and arguments. The layers are
+    # ordered from the most stable to the most volatile so that editing
+    # the model code doesn't invalidate the cached pip install layers.
+    stanzas = [_DOCKERFILE_BASE]
+    if args.local_pkg_dir:
+        stanzas.append(_DOCKERFILE_INSTALL_LOCAL_PKGS)
+    else:
+        stanzas.append(_DOCKERFILE_INSTALL_PKGS)
+    stanzas.append(_DOCKERFILE_INSTALL_MODEL_ZOO_REQUIREMENTS)
+    if cluster_spec_name:
+        stanzas.append(_DOCKERFILE_COPY_CLUSTER_SPEC)
+    stanzas.append(_DOCKERFILE_COPY_MODEL_ZOO)
+    docker_file_content = "\n".join(stanzas).format(
+        base_image=args.base_image,
+        extra_pypi_index=args.extra_pypi_index,
+        cluster_spec_name=cluster_spec_name,
+        local_pkg_dir=args.local_pkg_dir,
+        cluster_spec_dir=ClusterSpecConfig.CLUSTER_SPEC_DIR,
+        model_zoo_path=args.model_zoo,
     )
 
     with open("./Dockerfile", mode="w") as f:
         f.write(docker_file_content)
 
+    # Keep the user's own ignore rules if there are any
+    if not os.path.exists("./.dockerignore"):
+        with open("./.dockerignore", mode="w") as f:
+            f.write("\n".join(_DOCKER_IGNORE_PATTERNS) + "\n")
+
 
 def build_zoo(args):
     logger.info("Build the image for the model zoo.")
+    dockerfile = os.path.join(args.path, "Dockerfile")
+    if not os.path.exists(dockerfile):
+        raise RuntimeError(
+            "The Dockerfile {} doesn't exist".format(dockerfile)
+        )
     # Call docker api to build the image
     # Validate the image name schema
-    client = docker.DockerClient.from_env()
-    for line in client.api.build(
-        dockerfile="./Dockerfile",
-        path=args.path,
-        rm=True,
-        tag=args.image,
-        decode=True,
+    # Check the Docker daemon before packing the build context
+    client = _connect_docker_daemon()
+    # Skip the build if the image was built from the same context
+    files = _list_build_context(args.path)
+    context_hash = _hash_build_context(args.path, files)
+    if not args.force_rebuild and _is_image_up_to_date(
+        client, args.image, context_hash
     ):
-        _print_docker_progress(line)
+        logger.info(
+            "The build context is unchanged since the image %s was built, "
+            "skip building it." % args.image
+        )
+        return
+    # Pull the previously pushed image, if any and not built locally, so
+    # that its layers can seed the build cache on a machine with an empty
+    # local cache. The pull is network bound, so it runs while packing the
+    # build context.
+    executor = futures.ThreadPoolExecutor(max_workers=1)
+    pull_future = executor.submit(_pull_image_for_cache, client, args.image)
+    try:
+        context = _create_build_context(args.path, files)
+    except Exception:
+        # Report the packing error without waiting for the pull to finish
+        executor.shutdown(wait=False)
+        raise
+    with executor, context:
+        # A non-empty cache_from makes the classic builder ignore the plain
+        # local cache, so only list an image that is there.
+        cache_from = [args.image] if pull_future.result() else None
+        for line in client.build(
+            fileobj=context,
+            custom_context=True,
+            dockerfile="./Dockerfile",
+            rm=True,
+            tag=args.image,
+            cache_from=cache_from,
+            decode=True,
+        ):
+            _print_docker_progress(line)
+    _save_build_cache(client, args.image, context_hash)
 
 
 def push_zoo(args):
     logger.info("Push the image for the model zoo.")
     # Call docker api to push the image to remote registry
-    client = docker.DockerClient.from_env()
-    for line in client.api.push(args.image, stream=True, decode=True):
-        _print_docker_progress(line)
+    client = _docker_client()
+    _print_docker_push_progress(
+        client.push(args.image, stream=True, decode=True)
+    )
 
 
 def train(args):
-    container_args = [
-        "--worker_image",
-        args.image_name,
-        "--model_zoo",
-        args.model_zoo,
-        "--cluster_spec",
-        args.cluster_spec,
-    ]
-
-    container_args.extend(
-        build_arguments_from_parsed_result(
-            args,
-            filter_args=[
-                "model_zoo",
-                "cluster_spec",
-                "worker_image",
-                "force_use_kube_config_file",
-                "func",
-            ],
-        )
-    )
-
-    _submit_job(args.image_name, args, container_args)
+    _submit_job(args.image_name, args, _build_container_args(args))
 
 
 def evaluate(args):
-    container_args = [
-        "--worker_image",
-        args.image_name,
-        "--model_zoo",
-        args.model_zoo,
-        "--cluster_spec",
-        args.cluster_spec,
-    ]
-    container_args.extend(
-        build_arguments_from_parsed_result(
-            args,
-            filter_args=[
-                "model_zoo",
-                "cluster_spec",
-                "worker_image",
-                "force_use_kube_config_file",
-                "func",
-            ],
-        )
-    )
-
-    _submit_job(args.image_name, args, container_args)
+    _submit_job(args.image_name, args, _build_container_args(args))
 
 
 def predict(args):
-    container_args = [
+    _submit_job(args.image_name, args, _build_container_args(args))
+
+
+def _build_container_args(args):
+    return [
         "--worker_image",
         args.image_name,
         "--model_zoo",
         args.model_zoo,
         "--cluster_spec",
         args.cluster_spec,
-    ]
-
-    container_args.extend(
-        build_arguments_from_parsed_result(
-            args,
-            filter_args=[
-                "model_zoo",
-                "cluster_spec",
-                "worker_image",
-                "force_use_kube_config_file",
-                "func",
-            ],
-        )
+    ] + build_arguments_from_parsed_result(
+        args,
+        filter_args=[
+            "model_zoo",
+            "cluster_spec",
+            "worker_image",
+            "force_use_kube_config_file",
+            "func",
+        ],
     )
 
-    _submit_job(args.image_name, args, container_args)
-
 
 def _submit_job(image_name, client_args, container_args):
+    from elasticdl_client.common import k8s_client as k8s
+
     client = k8s.Client(
         image_name=image_name,
         namespace=client_args.namespace,
@@ -248,7 +287,28 @@ def _submit_job(image_name, client_args, container_args):
         )
 
 
+@functools.lru_cache(maxsize=1)
+def _docker_client():
+    """The Docker API client shared by all the calls in this process, so
+    that they reuse the same connection pool to the Docker daemon.
+    """
+    import docker
+
+    return docker.DockerClient.from_env().api
+
+
+def _connect_docker_daemon():
+    try:
+        client = _docker_client()
+        client.ping()
+    except Exception as ex:
+        raise RuntimeError("Failed to connect to the Docker daemon:\n%s" % ex)
+    return client
+
+
 def _get_docker_client(docker_base_url, docker_tlscert, docker_tlskey):
+    import docker
+
     if docker_tlscert and docker_tlskey:
         tls_config = docker.tls.TLSConfig(
             client_cert=(docker_tlscert, docker_tlskey)
@@ -258,6 +318,181 @@ def _get_docker_client(docker_base_url, docker_tlscert, docker_tlskey):
         return docker.APIClient(base_url=docker_base_url)
 
 
+def _list_build_context(path):
+    """List the files of the build context under `path`. The files
+    matched by the .dockerignore in `path`, or by `_DOCKER_IGNORE_PATTERNS`
+    if there is no .dockerignore, are left out.
+
+    Return:
+        A sorted list of the paths relative to `path`.
+    """
+    patterns = _DOCKER_IGNORE_PATTERNS
+    dockerignore = os.path.join(path, ".dockerignore")
+    if os.path.exists(dockerignore):
+        with open(dockerignore) as f:
+            lines = [line.strip() for line in f.read().splitlines()]
+            patterns = [
+                line for line in lines if line and not line.startswith("#")
+            ]
+    # The Dockerfile is always sent to the daemon like `docker build` does
+    patterns = patterns + ["!Dockerfile"]
+    return sorted(_walk_build_context(path, patterns))
+
+
+def _create_build_context(path, files):
+    """Pack the `files` of the build context under `path` into a tarball.
+
+    Return:
+        A temporary file object positioned at the beginning of the tarball,
+        which is deleted once closed.
+    """
+    import docker
+
+    context = tempfile.NamedTemporaryFile()
+    try:
+        return docker.utils.build.create_archive(
+            root=path, files=files, fileobj=context
+        )
+    except Exception:
+        # Don't leave a partial tarball behind, e.g. on an unreadable file
+        context.close()
+        raise
+
+
+def _hash_build_context(path, files):
+    """Hash the names, modes and contents of the `files` of the build
+    context under `path`.
+    """
+    context_hash = hashlib.sha256()
+    for name in files:
+        full_path = os.path.join(path, name)
+        mode = os.lstat(full_path).st_mode
+        context_hash.update(("%s\0%o\0" % (name, mode)).encode())
+        if stat.S_ISLNK(mode):
+            context_hash.update(os.readlink(full_path).encode())
+        elif stat.S_ISREG(mode):
+            with open(full_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    context_hash.update(chunk)
+    return context_hash.hexdigest()
+
+
+def _load_build_cache():
+    try:
+        with open(_BUILD_CACHE_FILE) as f:
+            build_cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return build_cache if isinstance(build_cache, dict) else {}
+
+
+def _is_image_up_to_date(client, image, context_hash):
+    import docker
+
+    cached = _load_build_cache().get(image, None)
+    if not isinstance(cached, dict):
+        return False
+    if cached.get("context_hash") != context_hash:
+        return False
+    try:
+        return client.inspect_image(image)["Id"] == cached.get("image_id")
+    except docker.errors.APIError:
+        return False
+
+
+def _save_build_cache(client, image, context_hash):
+    build_cache = _load_build_cache()
+    build_cache[image] = {
+        "context_hash": context_hash,
+        "image_id": client.inspect_image(image)["Id"],
+    }
+    # The cache is only an optimization, so failing to write it, e.g. with
+    # a read-only home directory, must not fail the build.
+    cache_dir = os.path.dirname(_BUILD_CACHE_FILE)
+    temp_file = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Replace the file atomically so that a concurrent build never
+        # reads a partially written cache.
+        with tempfile.NamedTemporaryFile(
+            mode="w", dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            temp_file = f.name
+            json.dump(build_cache, f, indent=2)
+        os.replace(temp_file, _BUILD_CACHE_FILE)
+    except OSError as ex:
+        logger.warning(
+            "Failed to save the build cache %s: %s" % (_BUILD_CACHE_FILE, ex)
+        )
+        if temp_file and os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def _walk_build_context(root, patterns):
+    """Yield the paths relative to `root` not matched by the .dockerignore
+    `patterns`. `os.scandir` tells directories from files without extra
+    `stat` calls, and the excluded directories are pruned unless an
+    exception pattern like "!dir/file" refers to some file inside them.
+    """
+    import docker
+
+    matcher = docker.utils.build.PatternMatcher(patterns)
+    exceptions = [
+        pattern.cleaned_pattern
+        for pattern in matcher.patterns
+        if pattern.exclusion
+    ]
+
+    def _walk(current_dir, relative_dir):
+        # The scandir iterator is a context manager only since Python 3.6
+        for entry in os.scandir(current_dir):
+            relative_path = os.path.join(relative_dir, entry.name)
+            excluded = matcher.matches(relative_path)
+            if not excluded:
+                yield relative_path
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if excluded and not any(
+                e.startswith(
+                    docker.utils.build.normalize_slashes(relative_path)
+                )
+                for e in exceptions
+            ):
+                continue
+            yield from _walk(entry.path, relative_path)
+
+    return _walk(root, "")
+
+
+def _pull_image_for_cache(client, image):
+    """Pull `image` unless it is already local.
+
+    Return:
+        Whether `image` is available locally to seed the build cache.
+    """
+    import docker
+
+    # Only seed an empty cache. Pulling over a local image would retag it
+    # to the pushed one and drop its local layers from the build cache.
+    try:
+        client.inspect_image(image)
+        return True
+    except docker.errors.ImageNotFound:
+        pass
+    repository, tag = docker.utils.parse_repository_tag(image)
+    logger.info("Pulling %s as the build cache." % image)
+    try:
+        client.pull(repository, tag=tag or "latest")
+    except docker.errors.APIError:
+        logger.info(
+            "The image %s is not available to pull, "
+            "build it with the local cache only." % image
+        )
+        return False
+    logger.info("Use the image %s as the build cache." % image)
+    return True
+
+
 def _print_docker_progress(line):
     error = line.get("error", None)
     if error:
@@ -267,3 +502,54 @@ def _print_docker_progress(line):
         print(stream, end="")
     else:
         print(line)
+
+
+def _print_docker_push_progress(lines):
+    """Print the status changes of the layers being pushed. The progress
+    details are only shown on a terminal, where the latest progress of every
+    layer still being pushed is refreshed in place on a single line at most
+    every `_PROGRESS_REFRESH_INTERVAL_SECS` seconds.
+    """
+    show_progress = sys.stdout.isatty()
+    last_refresh_time = 0
+    progress_width = 0
+    # Docker pushes several layers at once, keep the latest progress of each
+    layer_progress = collections.OrderedDict()
+    for line in lines:
+        error = line.get("error", None)
+        if error:
+            raise RuntimeError("Docker image push: " + error)
+        message = ": ".join(
+            str(line[key]) for key in ["id", "status"] if line.get(key)
+        )
+        if not message:
+            continue
+        progress = line.get("progress", None)
+        if progress:
+            message = "%s %s" % (message, progress)
+            layer_progress[line.get("id", None)] = message
+            now = time.monotonic()
+            if (
+                not show_progress
+                or now - last_refresh_time < _PROGRESS_REFRESH_INTERVAL_SECS
+            ):
+                continue
+            last_refresh_time = now
+            # Keep the line shorter than the terminal, or it would wrap and
+            # the carriage return could no longer overwrite it
+            message = "  ".join(layer_progress.values())[
+                : shutil.get_terminal_size().columns - 1
+            ]
+            sys.stdout.write("\r" + message.ljust(progress_width))
+            sys.stdout.flush()
+            progress_width = len(message)
+        else:
+            # The layer is done with the progress, e.g. it is pushed
+            layer_progress.pop(line.get("id", None), None)
+            if progress_width:
+                # Move on from the progress bar line
+                sys.stdout.write("\r" + " " * progress_width + "\r")
+                progress_width = 0
+            print(message)
+    if progress_width:
+        sys.stdout.write("\n")
@@ -11,9 +11,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import argparse
 from itertools import chain
 
 from elasticdl_client.common.constants import DistributionStrategy
+from elasticdl_client.common.k8s_resource import parse as parse_resource
 
 DEFAULT_BASE_IMAGE = "python:3.6"
 
@@ -65,6 +67,13 @@ def add_zoo_build_params(parser):
         help="The name of the docker image we are building for"
         "this model zoo.",
     )
+    add_bool_param(
+        parser=parser,
+        name="--force_rebuild",
+        default=False,
+        help="If true, build the image even if the build context is "
+        "unchanged since the image was built last time.",
+    )
 
 
 def add_zoo_push_params(parser):
@@ -210,13 +219,13 @@ def add_common_params(parser):
     parser.add_argument(
         "--master_resource_request",
         default="cpu=0.1,memory=1024Mi",
-        type=str,
+        type=resource_spec,
         help="The minimal resource required by master, "
         "e.g. cpu=0.1,memory=1024Mi,disk=1024Mi,gpu=1",
     )
     parser.add_argument(
         "--master_resource_limit",
-        type=str,
+        type=resource_spec,
         default="",
         help="The maximal resource required by master, "
         "e.g. cpu=0.1,memory=1024Mi,disk=1024Mi,gpu=1, "
@@ -228,13 +237,13 @@ def add_common_params(parser):
     parser.add_argument(
         "--worker_resource_request",
         default="cpu=1,memory=4096Mi",
-        type=str,
+        type=resource_spec,
         help="The minimal resource required by worker, "
         "e.g. cpu=1,memory=1024Mi,disk=1024Mi,gpu=1",
     )
     parser.add_argument(
         "--worker_resource_limit",
-        type=str,
+        type=resource_spec,
         default="",
         help="The maximal resource required by worker, "
         "e.g. cpu=1,memory=1024Mi,disk=1024Mi,gpu=1,"
@@ -259,17 +268,17 @@ def add_common_params(parser):
     parser.add_argument(
         "--ps_resource_request",
         default="cpu=1,memory=4096Mi",
-        type=str,
-        help="The minimal resource required by worker, "
+        type=resource_spec,
+        help="The minimal resource required by PS, "
         "e.g. cpu=1,memory=1024Mi,disk=1024Mi,gpu=1",
     )
     parser.add_argument(
         "--ps_resource_limit",
         default="",
-        type=str,
-        help="The maximal resource required by worker, "
+        type=resource_spec,
+        help="The maximal resource required by PS, "
         "e.g. cpu=1,memory=1024Mi,disk=1024Mi,gpu=1,"
-        "default to worker_resource_request",
+        "default to ps_resource_request",
     )
     parser.add_argument(
         "--ps_pod_priority",
@@ -307,11 +316,6 @@ def add_common_params(parser):
         help="Runtime environment variables. (key1=value1,key2=value2), "
         "comma is supported in value field",
     )
-    parser.add_argument(
-        "--extra_pypi_index",
-        default="https://pypi.org/simple",
-        help="The extra URLs of Python package repository indexes",
-    )
     parser.add_argument(
         "--namespace",
         default="default",
@@ -501,6 +505,18 @@ def add_common_args_between_master_and_worker(parser):
     )
 
 
+def resource_spec(arg):
+    """Validate the k8s resource string, e.g. "cpu=1,memory=1024Mi",
+    while parsing the arguments.
+    """
+    if arg:
+        try:
+            parse_resource(arg)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return arg
+
+
 def parse_envs(arg):
     """Parse environment configs as a dict.
 
@@ -24,8 +24,75 @@ from elasticdl_client.api import (
 )
 from elasticdl_client.common import args
 
+# The parameters of each command are only added when the command is
+# selected, so that `elasticdl train` doesn't pay for building the parsers
+# of all the other commands.
+_ZOO_COMMANDS = [
+    (
+        "init",
+        "Initialize the model zoo.",
+        init_zoo,
+        [args.add_zoo_init_params],
+    ),
+    (
+        "build",
+        "Build a docker image for the model zoo.",
+        build_zoo,
+        [args.add_zoo_build_params],
+    ),
+    (
+        "push",
+        "Push the docker image to a remote registry for the distributed "
+        "ElasticDL job.",
+        push_zoo,
+        [args.add_zoo_push_params],
+    ),
+]
+
+_JOB_COMMANDS = [
+    (
+        "train",
+        "Submit a ElasticDL distributed training job",
+        train,
+        [args.add_common_params, args.add_train_params],
+    ),
+    (
+        "evaluate",
+        "Submit a ElasticDL distributed evaluation job",
+        evaluate,
+        [args.add_common_params, args.add_evaluate_params],
+    ),
+    (
+        "predict",
+        "Submit a ElasticDL distributed prediction job",
+        predict,
+        [args.add_common_params, args.add_predict_params],
+    ),
+]
+
+
+def _add_commands(subparsers, commands, selected_command):
+    for name, help_text, func, add_params_fns in commands:
+        command_parser = subparsers.add_parser(name, help=help_text)
+        command_parser.set_defaults(func=func)
+        if selected_command is None or selected_command == name:
+            for add_params_fn in add_params_fns:
+                add_params_fn(command_parser)
+
+
+def build_argument_parser(argv=None):
+    """Build the argument parser for the `elasticdl` commands.
+
+    Args:
+        argv: The command line arguments to parse. If set, only the
+            parameters of the command selected by `argv` are added to the
+            parser. Otherwise, the parameters of all commands are added.
+    """
+    command = zoo_command = None
+    if argv is not None:
+        command = argv[0] if argv else ""
+        zoo_command = argv[1] if len(argv) > 1 else ""
 
-def build_argument_parser():
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers()
     subparsers.required = True
@@ -37,59 +104,17 @@ def build_argument_parser():
     )
     zoo_subparsers = zoo_parser.add_subparsers()
     zoo_subparsers.required = True
+    if command is None or command == "zoo":
+        _add_commands(zoo_subparsers, _ZOO_COMMANDS, zoo_command)
 
-    # elasticdl zoo init
-    zoo_init_parser = zoo_subparsers.add_parser(
-        "init", help="Initialize the model zoo."
-    )
-    zoo_init_parser.set_defaults(func=init_zoo)
-    args.add_zoo_init_params(zoo_init_parser)
-
-    # elasticdl zoo build
-    zoo_build_parser = zoo_subparsers.add_parser(
-        "build", help="Build a docker image for the model zoo."
-    )
-    zoo_build_parser.set_defaults(func=build_zoo)
-    args.add_zoo_build_params(zoo_build_parser)
-
-    # elasticdl zoo push
-    zoo_push_parser = zoo_subparsers.add_parser(
-        "push",
-        help="Push the docker image to a remote registry for the distributed"
-        "ElasticDL job.",
-    )
-    zoo_push_parser.set_defaults(func=push_zoo)
-    args.add_zoo_push_params(zoo_push_parser)
-
-    # elasticdl train
-    train_parser = subparsers.add_parser(
-        "train", help="Submit a ElasticDL distributed training job"
-    )
-    train_parser.set_defaults(func=train)
-    args.add_common_params(train_parser)
-    args.add_train_params(train_parser)
-
-    # elasticdl evaluate
-    evaluate_parser = subparsers.add_parser(
-        "evaluate", help="Submit a ElasticDL distributed evaluation job"
-    )
-    evaluate_parser.set_defaults(func=evaluate)
-    args.add_common_params(evaluate_parser)
-    args.add_evaluate_params(evaluate_parser)
-
-    # elasticdl predict
-    predict_parser = subparsers.add_parser(
-        "predict", help="Submit a ElasticDL distributed prediction job"
-    )
-    predict_parser.set_defaults(func=predict)
-    args.add_common_params(predict_parser)
-    args.add_predict_params(predict_parser)
+    # elasticdl train | evaluate | predict
+    _add_commands(subparsers, _JOB_COMMANDS, command)
 
     return parser
 
 
 def main():
-    parser = build_argument_parser()
+    parser = build_argument_parser(sys.argv[1:])
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
         sys.exit(1)
@@ -0,0 +1,414 @@
+# Copyright 2020 The ElasticDL Authors. All rights reserved.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import docker
+
+from elasticdl_client import api
+from elasticdl_client.main import build_argument_parser
+
+
+class APITest(unittest.TestCase):
+    def setUp(self):
+        self._parser = build_argument_parser()
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self._temp_dir.name)
+        # Keep the build cache out of the build context
+        self._cache_dir = tempfile.TemporaryDirectory()
+        self._build_cache_patch = patch.object(
+            api,
+            "_BUILD_CACHE_FILE",
+            os.path.join(self._cache_dir.name, "build_cache.json"),
+        )
+        self._build_cache_patch.start()
+
+    def tearDown(self):
+        self._build_cache_patch.stop()
+        self._cache_dir.cleanup()
+        os.chdir(self._cwd)
+        self._temp_dir.cleanup()
+
+    def _init_zoo(self, argv):
+        args = self._parser.parse_args(["zoo", "init"] + argv)
+        args.func(args)
+        with open("Dockerfile") as f:
+            return f.read()
+
+    def test_init_zoo_layer_order(self):
+        with open("cluster_spec.py", "w") as f:
+            f.write("cluster = None\n")
+        content = self._init_zoo(["--cluster_spec=cluster_spec.py"])
+
+        # The model zoo requirements are installed before the model zoo
+        # is copied, so editing the model code keeps the pip layers cached.
+        requirements_index = content.index(
+            "COPY ./requirements.txt /model_zoo/requirements.txt"
+        )
+        pip_index = content.index(
+            "RUN pip install --no-cache-dir -r /model_zoo/"
+        )
+        cluster_spec_index = content.index("COPY ./cluster_spec.py")
+        model_zoo_index = content.index("COPY . /model_zoo")
+        self.assertLess(requirements_index, pip_index)
+        self.assertLess(pip_index, cluster_spec_index)
+        self.assertLess(cluster_spec_index, model_zoo_index)
+        self.assertTrue(content.rstrip().endswith("COPY . /model_zoo"))
+        # The ElasticDL packages are installed and set up in one layer
+        self.assertEqual(content.count("RUN "), 2)
+
+    def test_init_zoo_cluster_spec(self):
+        os.mkdir("specs")
+        cluster_spec = os.path.join("specs", "cluster_spec.py")
+        with open(cluster_spec, "w") as f:
+            f.write("cluster = None\n")
+        with open("cluster_spec.py", "w") as f:
+            f.write("stale = True\n")
+
+        self._init_zoo(["--cluster_spec=" + cluster_spec])
+        with open("cluster_spec.py") as f:
+            self.assertEqual(f.read(), "cluster = None\n")
+        # The copy in the build context is independent of the original
+        self.assertFalse(os.path.samefile(cluster_spec, "cluster_spec.py"))
+
+        # Initializing again with the file in place is a no-op
+        self._init_zoo(["--cluster_spec=cluster_spec.py"])
+        with open("cluster_spec.py") as f:
+            self.assertEqual(f.read(), "cluster = None\n")
+
+    def test_init_zoo_dockerignore(self):
+        self._init_zoo([])
+        with open(".dockerignore") as f:
+            patterns = f.read().splitlines()
+        self.assertIn(".git", patterns)
+        self.assertIn("**/__pycache__", patterns)
+
+        # An existing .dockerignore is left untouched
+        with open(".dockerignore", "w") as f:
+            f.write("data\n")
+        self._init_zoo([])
+        with open(".dockerignore") as f:
+            self.assertEqual(f.read(), "data\n")
+
+    def _context_names(self, path):
+        files = api._list_build_context(path)
+        with api._create_build_context(path, files) as context:
+            with tarfile.open(fileobj=context) as tar:
+                return sorted(tar.getnames())
+
+    def test_create_build_context(self):
+        os.makedirs(os.path.join("model", "__pycache__"))
+        os.mkdir(".git")
+        for name in [
+            "Dockerfile",
+            "requirements.txt",
+            os.path.join("model", "model.py"),
+            os.path.join("model", "__pycache__", "model.cpython-36.pyc"),
+            os.path.join(".git", "HEAD"),
+        ]:
+            with open(name, "w") as f:
+                f.write(name)
+
+        # Without a .dockerignore, the default patterns are applied
+        self.assertEqual(
+            self._context_names("."),
+            ["Dockerfile", "model", "model/model.py", "requirements.txt"],
+        )
+
+        # The .dockerignore takes precedence over the default patterns
+        with open(".dockerignore", "w") as f:
+            f.write("# comment\nmodel\n")
+        self.assertEqual(
+            self._context_names("."),
+            [
+                ".dockerignore",
+                ".git",
+                ".git/HEAD",
+                "Dockerfile",
+                "requirements.txt",
+            ],
+        )
+
+        # The files excepted from an ignored directory are still sent
+        with open(".dockerignore", "w") as f:
+            f.write(".git\nmodel\n!model/model.py\nDockerfile\n")
+        expected_names = [
+            ".dockerignore",
+            "Dockerfile",
+            "model/model.py",
+            "requirements.txt",
+        ]
+        self.assertEqual(self._context_names("."), expected_names)
+
+        # The patterns are normalized like docker-py does
+        with open(".dockerignore", "w") as f:
+            f.write(".git\n  # comment\nmodel\n!./model/model.py\n")
+        self.assertEqual(self._context_names("."), expected_names)
+
+    def test_create_build_context_failure(self):
+        with open("Dockerfile", "w") as f:
+            f.write("FROM python:3.6\n")
+        context = tempfile.NamedTemporaryFile()
+        with patch("tempfile.NamedTemporaryFile", return_value=context):
+            with self.assertRaises(OSError):
+                api._create_build_context(".", ["Dockerfile", "missing.py"])
+        self.assertTrue(context.closed)
+        self.assertFalse(os.path.exists(context.name))
+
+    def test_build_zoo_packing_failure(self):
+        client = MagicMock()
+        client.inspect_image.side_effect = docker.errors.ImageNotFound("")
+        pull_done = threading.Event()
+        client.pull.side_effect = lambda *args, **kwargs: pull_done.wait(10)
+        args = self._parser.parse_args(["zoo", "build", "--image=i:1", "."])
+        with open("Dockerfile", "w") as f:
+            f.write("FROM python:3.6\n")
+        # The packing error is raised without waiting for the pull
+        start_time = time.monotonic()
+        with patch.object(api, "_docker_client", return_value=client):
+            with patch.object(
+                api, "_create_build_context", side_effect=OSError("denied")
+            ):
+                with self.assertRaisesRegex(OSError, "denied"):
+                    args.func(args)
+        self.assertLess(time.monotonic() - start_time, 5)
+        pull_done.set()
+        client.build.assert_not_called()
+
+    def test_build_zoo_with_cache_from(self):
+        client = MagicMock()
+        client.build.return_value = [{"stream": "Step 1/1\n"}]
+        client.inspect_image.return_value = {"Id": "sha256:1"}
+        image = "a_docker_registry/bright/elasticdl-wnd:1.0"
+        args = self._parser.parse_args(["zoo", "build", "--image", image, "."])
+        with open("Dockerfile", "w") as f:
+            f.write("FROM python:3.6\n")
+        not_found = docker.errors.ImageNotFound("not found")
+        client.inspect_image.side_effect = [not_found, {"Id": "sha256:1"}]
+        with patch.object(api, "_docker_client", return_value=client):
+            args.func(args)
+        client.pull.assert_called_once_with(
+            "a_docker_registry/bright/elasticdl-wnd", tag="1.0"
+        )
+        _, kwargs = client.build.call_args
+        self.assertEqual(kwargs["cache_from"], [image])
+        self.assertTrue(kwargs["custom_context"])
+
+        # The build keeps the local layer cache if the image can't be pulled
+        client.reset_mock()
+        client.inspect_image.side_effect = [not_found, {"Id": "sha256:1"}]
+        client.pull.side_effect = docker.errors.NotFound("not found")
+        args.force_rebuild = True
+        with patch.object(api, "_docker_client", return_value=client):
+            args.func(args)
+        _, kwargs = client.build.call_args
+        self.assertIsNone(kwargs["cache_from"])
+
+    def test_build_zoo_with_local_image(self):
+        client = MagicMock()
+        client.build.return_value = [{"stream": "Step 1/1\n"}]
+        client.inspect_image.return_value = {"Id": "sha256:1"}
+        args = self._parser.parse_args(["zoo", "build", "--image=i:1", "."])
+        with open("Dockerfile", "w") as f:
+            f.write("FROM python:3.6\n")
+        with patch.object(api, "_docker_client", return_value=client):
+            args.func(args)
+        # The local image is the build cache, it isn't replaced by a pull
+        client.pull.assert_not_called()
+        _, kwargs = client.build.call_args
+        self.assertEqual(kwargs["cache_from"], ["i:1"])
+
+    def test_build_zoo_skip_unchanged_context(self):
+        client = MagicMock()
+        client.build.return_value = [{"stream": "Step 1/1\n"}]
+        client.inspect_image.return_value = {"Id": "sha256:1"}
+        args = self._parser.parse_args(["zoo", "build", "--image=i:1", "."])
+        with open("Dockerfile", "w") as f:
+            f.write("FROM python:3.6\n")
+
+        with patch.object(api, "_docker_client", return_value=client):
+            args.func(args)
+            args.func(args)
+            self.assertEqual(client.build.call_count, 1)
+
+            # Any change in the context triggers a build
+            with open("model.py", "w") as f:
+                f.write("model = None\n")
+            args.func(args)
+            self.assertEqual(client.build.call_count, 2)
+
+            # So does an image which doesn't match the cached one
+            client.inspect_image.return_value = {"Id": "sha256:2"}
+            args.func(args)
+            self.assertEqual(client.build.call_count, 3)
+            args.func(args)
+            self.assertEqual(client.build.call_count, 3)
+
+            args.force_rebuild = True
+            args.func(args)
+            self.assertEqual(client.build.call_count, 4)
+
+    def test_build_cache_failures(self):
+        client = MagicMock()
+        client.build.return_value = [{"stream": "Step 1/1\n"}]
+        client.inspect_image.return_value = {"Id": "sha256:1"}
+        args = self._parser.parse_args(["zoo", "build", "--image=i:1", "."])
+        with open("Dockerfile", "w") as f:
+            f.write("FROM python:3.6\n")
+
+        # A malformed cache entry triggers a build instead of an error
+        with open(api._BUILD_CACHE_FILE, "w") as f:
+            json.dump({"i:1": {"image_id": "sha256:1"}}, f)
+        with patch.object(api, "_docker_client", return_value=client):
+            args.func(args)
+        client.build.assert_called_once()
+        with open(api._BUILD_CACHE_FILE) as f:
+            self.assertEqual(json.load(f)["i:1"]["image_id"], "sha256:1")
+        self.assertEqual(
+            os.listdir(self._cache_dir.name), ["build_cache.json"]
+        )
+
+        # An unwritable cache only logs a warning once the image is built
+        client.reset_mock()
+        unwritable_cache = os.path.join("Dockerfile", "build_cache.json")
+        with patch.object(api, "_BUILD_CACHE_FILE", unwritable_cache):
+            with patch.object(api, "_docker_client", return_value=client):
+                with patch.object(api.logger, "warning") as warning:
+                    args.func(args)
+        client.build.assert_called_once()
+        warning.assert_called_once()
+
+    def test_build_zoo_fail_fast(self):
+        client = MagicMock()
+        args = self._parser.parse_args(["zoo", "build", "--image=i:1", "."])
+        with patch.object(api, "_docker_client", return_value=client):
+            with self.assertRaisesRegex(RuntimeError, "Dockerfile"):
+                args.func(args)
+
+            with open("Dockerfile", "w") as f:
+                f.write("FROM python:3.6\n")
+            client.ping.side_effect = docker.errors.APIError("down")
+            with self.assertRaisesRegex(RuntimeError, "Docker daemon"):
+                args.func(args)
+        client.pull.assert_not_called()
+        client.build.assert_not_called()
+
+    def test_build_container_args(self):
+        args = self._parser.parse_args(
+            [
+                "train",
+                "--image_name=elasticdl:mnist",
+                "--job_name=test",
+                "--model_zoo=model_zoo",
+                "--model_def=mnist.mnist_functional_api.custom_model",
+                "--worker_resource_request=cpu=1,memory=1024Mi",
+                "--worker_resource_limit=cpu=2,memory=2048Mi",
+            ]
+        )
+        container_args = api._build_container_args(args)
+        self.assertEqual(
+            container_args[:6],
+            [
+                "--worker_image",
+                "elasticdl:mnist",
+                "--model_zoo",
+                "model_zoo",
+                "--cluster_spec",
+                "",
+            ],
+        )
+        # Every argument is passed to the master with its own value
+        options = dict(zip(container_args[::2], container_args[1::2]))
+        self.assertEqual(
+            options["--worker_resource_request"], "cpu=1,memory=1024Mi"
+        )
+        self.assertEqual(
+            options["--worker_resource_limit"], "cpu=2,memory=2048Mi"
+        )
+        self.assertNotIn("--func", options)
+
+    def test_print_docker_push_progress(self):
+        lines = [
+            {"status": "The push refers to repository [registry/image]"},
+            {"id": "a1", "status": "Preparing"},
+            {"id": "a1", "status": "Pushing", "progress": "[=>   ] 1MB/9MB"},
+            {"id": "a1", "status": "Pushing", "progress": "[===> ] 7MB/9MB"},
+            {"id": "a1", "status": "Pushed"},
+            {"progressDetail": {}, "aux": {"Tag": "1.0"}},
+        ]
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            api._print_docker_push_progress(iter(lines))
+        # The progress isn't printed if stdout isn't a terminal
+        self.assertEqual(
+            stdout.getvalue().splitlines(),
+            [
+                "The push refers to repository [registry/image]",
+                "a1: Preparing",
+                "a1: Pushed",
+            ],
+        )
+
+        with self.assertRaisesRegex(RuntimeError, "denied"):
+            api._print_docker_push_progress(iter([{"error": "denied"}]))
+
+    def test_print_docker_push_progress_on_terminal(self):
+        class _Terminal(io.StringIO):
+            def isatty(self):
+                return True
+
+        lines = [
+            {"id": "a1", "status": "Preparing"},
+            {"id": "a1", "status": "Pushing", "progress": "[=>  ] 1MB/9MB"},
+            {"id": "b2", "status": "Pushing", "progress": "[=>] 1MB/3MB"},
+            {"id": "a1", "status": "Pushing", "progress": "7MB"},
+            {"id": "a1", "status": "Pushed"},
+            {"id": "b2", "status": "Pushing", "progress": "[=] 2MB"},
+        ]
+        # The second progress arrives within the refresh interval
+        times = [1.0, 1.0 + api._PROGRESS_REFRESH_INTERVAL_SECS / 2, 1.2, 1.3]
+        with patch("sys.stdout", new_callable=_Terminal) as stdout:
+            with patch.object(api.time, "monotonic", side_effect=times):
+                with patch.object(
+                    api.shutil,
+                    "get_terminal_size",
+                    return_value=os.terminal_size((80, 24)),
+                ):
+                    api._print_docker_push_progress(iter(lines))
+
+        first_progress = "a1: Pushing [=>  ] 1MB/9MB"
+        # The progress of every layer being pushed is shown
+        last_progress = "a1: Pushing 7MB  b2: Pushing [=>] 1MB/3MB"
+        self.assertEqual(
+            stdout.getvalue(),
+            "a1: Preparing\n"
+            # Progress is refreshed in place
+            + "\r" + first_progress + "\r" + last_progress
+            # The progress line is cleared before the next status line
+            + "\r" + " " * len(last_progress) + "\r" + "a1: Pushed\n"
+            # The pushed layer is dropped and the line is terminated
+            + "\rb2: Pushing [=] 2MB\n",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 import unittest
 
 from elasticdl_client.common.args import DEFAULT_BASE_IMAGE
@@ -20,6 +22,14 @@ from elasticdl_client.main import build_argument_parser
 class ArgParserTest(unittest.TestCase):
     def setUp(self):
         self._parser = build_argument_parser()
+        # `elasticdl zoo init` writes into the working directory
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self._temp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._temp_dir.cleanup()
 
     def test_parse_zoo_init(self):
         args = ["zoo", "init"]
@@ -70,3 +80,26 @@ class ArgParserTest(unittest.TestCase):
         with self.assertRaises(SystemExit):
             args = ["zoo", "push"]
             args = self._parser.parse_args(args)
+
+    def test_parse_selected_command_only(self):
+        args = [
+            "train",
+            "--job_name=test",
+            "--model_zoo=model_zoo",
+            "--model_def=mnist.mnist_functional_api.custom_model",
+            "--num_epochs=2",
+        ]
+        parser = build_argument_parser(args)
+        parsed_args = parser.parse_args(args)
+        self.assertEqual(parsed_args.num_epochs, 2)
+        self.assertEqual(parsed_args.func.__name__, "train")
+
+        # The parameters of the other commands are not added
+        with self.assertRaises(SystemExit):
+            parser.parse_args(["zoo", "push", "image:1.0"])
+
+        args = ["zoo", "push", "a_docker_registry/bright/elasticdl-wnd:1.0"]
+        parsed_args = build_argument_parser(args).parse_args(args)
+        self.assertEqual(
+            parsed_args.image, "a_docker_registry/bright/elasticdl-wnd:1.0"
+        )
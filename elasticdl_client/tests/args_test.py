@@ -16,6 +16,7 @@ import unittest
 
 from elasticdl_client.common.args import (
     add_bool_param,
+    add_common_params,
     build_arguments_from_parsed_result,
     wrap_python_args_with_string,
 )
@@ -68,3 +69,26 @@ class ArgsTest(unittest.TestCase):
             "''",
         ]
         self.assertListEqual(args, expected_args)
+
+    def test_resource_spec(self):
+        parser = argparse.ArgumentParser()
+        add_common_params(parser)
+        required_args = [
+            "--job_name=test",
+            "--model_zoo=model_zoo",
+            "--model_def=mnist.mnist_functional_api.custom_model",
+        ]
+        args = parser.parse_args(
+            required_args + ["--worker_resource_request=cpu=2,memory=1Gi"]
+        )
+        self.assertEqual(args.worker_resource_request, "cpu=2,memory=1Gi")
+        self.assertEqual(args.worker_resource_limit, "")
+
+        # An invalid resource string is rejected by the parser
+        for invalid_arg in [
+            "--master_resource_request=cpu=0.1,memory=1024",
+            "--worker_resource_limit=cpu=abc",
+            "--ps_resource_request=cpu=1,foo=1",
+        ]:
+            with self.assertRaises(SystemExit):
+                parser.parse_args(required_args + [invalid_arg])